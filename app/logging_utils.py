@@ -1,10 +1,9 @@
 import logging
-import json
+import orjson
 import time
 import uuid
-from datetime import datetime, timezone
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import contextvars
 
 from app.metrics import record_http_request
@@ -12,6 +11,15 @@ from app.metrics import record_http_request
 REQUEST_ID_CTX_KEY = "request_id"
 _request_id_ctx_var: contextvars.ContextVar[str] = contextvars.ContextVar(REQUEST_ID_CTX_KEY, default=None)
 
+def _iso_now() -> str:
+    # Same output as datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    # without allocating a datetime or running the strftime parser.
+    t = time.time()
+    s = int(t)
+    us = int((t - s) * 1_000_000)
+    tm = time.gmtime(s)
+    return f"{tm.tm_year:04d}-{tm.tm_mon:02d}-{tm.tm_mday:02d}T{tm.tm_hour:02d}:{tm.tm_min:02d}:{tm.tm_sec:02d}.{us:06d}Z"
+
 class JsonFormatter(logging.Formatter):
     def format(self, record):
         if isinstance(record.msg, dict):
@@ -20,7 +28,7 @@ class JsonFormatter(logging.Formatter):
             log_record = {"message": record.getMessage()}
 
         if "ts" not in log_record:
-            log_record["ts"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            log_record["ts"] = _iso_now()
         
         if "level" not in log_record:
             log_record["level"] = record.levelname
@@ -30,7 +38,7 @@ class JsonFormatter(logging.Formatter):
             if rid:
                 log_record["request_id"] = rid
 
-        return json.dumps(log_record)
+        return orjson.dumps(log_record).decode()
 
 def setup_logging(log_level: str):
     root_logger = logging.getLogger()
@@ -41,42 +49,57 @@ def setup_logging(log_level: str):
     handler.setFormatter(JsonFormatter())
     root_logger.addHandler(handler)
 
-class RequestLogMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        request_id = request.headers.get("X-Request-ID", str(uuid.uuid4()))
+class RequestLogMiddleware:
+    """Pure ASGI access-log middleware.
+
+    Avoids BaseHTTPMiddleware's per-request task group and Request/Response
+    wrapping. Endpoints pass webhook details back via ``request.state``,
+    which is backed by ``scope["state"]``.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get("X-Request-ID") or str(uuid.uuid4())
         token = _request_id_ctx_var.set(request_id)
-        
-        start_time = time.time()
+        state = scope.setdefault("state", {})
+
+        start_time = time.perf_counter()
         status_code = 500
-        
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message)["X-Request-ID"] = request_id
+            await send(message)
+
         try:
-            response = await call_next(request)
-            status_code = response.status_code
-            response.headers["X-Request-ID"] = request_id
-            return response
-        except Exception:
-            raise
+            await self.app(scope, receive, send_wrapper)
         finally:
-            latency_ms = (time.time() - start_time) * 1000
-            
+            latency_ms = (time.perf_counter() - start_time) * 1000
+            path = scope["path"]
+
             log_payload = {
-                "ts": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+                "ts": _iso_now(),
                 "level": "INFO",
                 "request_id": request_id,
-                "method": request.method,
-                "path": request.url.path,
+                "method": scope["method"],
+                "path": path,
                 "status": status_code,
                 "latency_ms": round(latency_ms, 2)
             }
-            
-            if request.url.path == "/webhook":
-                if hasattr(request.state, "message_id"):
-                    log_payload["message_id"] = request.state.message_id
-                if hasattr(request.state, "dup"):
-                    log_payload["dup"] = request.state.dup
-                if hasattr(request.state, "result"):
-                    log_payload["result"] = request.state.result
+
+            if path == "/webhook":
+                for key in ("message_id", "dup", "result"):
+                    if key in state:
+                        log_payload[key] = state[key]
 
             logging.getLogger("access").info(log_payload)
-            record_http_request(request.url.path, status_code, latency_ms)
-            _request_id_ctx_var.reset(token)
\ No newline at end of file
+            record_http_request(path, status_code, latency_ms)
+            _request_id_ctx_var.reset(token)
@@ -7,7 +7,10 @@ from typing import Optional, List
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, HTTPException, Depends, Query, Response, status
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import ValidationError
+import orjson
 
 from app.config import settings
 from app.storage import Storage
@@ -21,12 +24,21 @@ setup_logging(settings.LOG_LEVEL)
 # Initialize Storage
 storage = Storage(settings.DATABASE_URL)
 
+# Pre-keyed HMAC state; each request copies it instead of re-deriving the key pads
+_hmac_template = hmac.new(settings.WEBHOOK_SECRET.encode(), None, hashlib.sha256)
+
+class ORJSONResponse(JSONResponse):
+    # orjson writes compact bytes directly, skipping the stdlib encoder
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NAIVE_UTC)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await storage.init_db()
     yield
+    await storage.close()
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Middleware
 app.add_middleware(RequestLogMiddleware)
@@ -51,7 +63,14 @@ async def verify_signature(request: Request):
          # Actually, better to check signature if present, else 401.
          pass # Handled below
     
-    body = await request.body()
+    # Hash the body incrementally as it arrives instead of buffering it first
+    h = _hmac_template.copy()
+    body_chunks = []
+    async for chunk in request.stream():
+        h.update(chunk)
+        body_chunks.append(chunk)
+    # Cache the body so later reads (request.body()/json()) still see it
+    body = request._body = b"".join(body_chunks)
     
     # Compute signature
     # Signature usually format "sha256=<hex>" or just "<hex>"
@@ -61,28 +80,42 @@ async def verify_signature(request: Request):
          raise HTTPException(status_code=401, detail="invalid signature")
 
     # simplified handling: assume header is just the hex digest or sha256=digest
-    sig_hash = signature
-    if signature.startswith("sha256="):
-        sig_hash = signature.split("=")[1]
-        
-    expected_hash = hmac.new(
-        key=settings.WEBHOOK_SECRET.encode(),
-        msg=body,
-        digestmod=hashlib.sha256
-    ).hexdigest()
+    # Compare the 32 raw digest bytes rather than 64 hex characters
+    try:
+        sig_bytes = bytes.fromhex(signature.removeprefix("sha256="))
+    except ValueError:
+        raise HTTPException(status_code=401, detail="invalid signature")
     
-    if not hmac.compare_digest(sig_hash, expected_hash):
+    if not hmac.compare_digest(sig_bytes, h.digest()):
         raise HTTPException(status_code=401, detail="invalid signature")
 
+    return body
+
 # --- Routes ---
 
-@app.post("/webhook", response_model=WebhookResponse)
-async def webhook(
-    request: Request,
-    payload: WebhookMessageIn, 
-):
+# The body is parsed by hand from the verified bytes, so document its schema here
+@app.post(
+    "/webhook",
+    response_model=WebhookResponse,
+    openapi_extra={
+        "requestBody": {
+            "content": {"application/json": {"schema": WebhookMessageIn.model_json_schema()}},
+            "required": True,
+        }
+    },
+)
+async def webhook(request: Request):
     # Verify signature first
-    await verify_signature(request)
+    body = await verify_signature(request)
+    
+    # Validate straight from the raw bytes (parsed in pydantic-core, no dict intermediary)
+    try:
+        payload = WebhookMessageIn.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)],
+            body=body,
+        )
     
     # Store message_id in state for logging
     request.state.message_id = payload.message_id
@@ -105,7 +138,9 @@ async def webhook(
     
     return WebhookResponse(status="ok")
 
-@app.get("/messages", response_model=MessagesListResponse)
+# Rows from storage already match MessagesListResponse, so the model only documents
+# the response; returning ORJSONResponse skips per-row validation and encoding.
+@app.get("/messages", responses={200: {"model": MessagesListResponse}})
 async def get_messages(
     limit: int = Query(50, ge=1, le=100),
     offset: int = 0,
@@ -114,12 +149,12 @@ async def get_messages(
     q: Optional[str] = None
 ):
     data, total = await storage.query_messages(limit, offset, from_, since, q)
-    return {
+    return ORJSONResponse(content={
         "data": data,
         "total": total,
         "limit": limit,
         "offset": offset
-    }
+    })
 
 @app.get("/stats", response_model=StatsResponse)
 async def get_stats():
@@ -140,7 +175,8 @@ async def health_ready():
         raise HTTPException(status_code=503, detail="Not ready")
 
 @app.get("/metrics")
-def get_metrics():
+async def get_metrics():
+    # async so rendering runs on the event loop thread alongside recording (metrics are lock-free)
     return PlainTextResponse(render_metrics())
 
 if __name__ == "__main__":
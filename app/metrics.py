@@ -1,21 +1,40 @@
+import array
+import bisect
+import io
 import threading
 import time
 from typing import Dict, List, Tuple
 
 class Metrics:
+    # Recording and rendering take no lock: they are only called from the
+    # event loop thread, so updates are already serialized (uvicorn's default
+    # single-process, single-thread asyncio model). With multiple workers each
+    # process keeps its own counts; use prometheus_client's multiprocess mode
+    # for that setup instead. The lock only guards singleton construction.
     _instance = None
     _lock = threading.Lock()
 
     def __init__(self):
-        # Counters: (name, frozenset(labels.items())) -> value
-        self.counters: Dict[Tuple[str, frozenset], float] = {}
+        # Counters: (name, *label_values) -> value. Label order is fixed per metric.
+        self.counters: Dict[Tuple[str, ...], float] = {}
+        # Rendered "{k="v",...}" suffix per counter, built when the series is first seen
+        self._counter_label_strs: Dict[Tuple[str, ...], str] = {}
         
-        # Histograms: (name, frozenset(labels.items())) -> list of bucket counts
         # Buckets for latency in ms
-        self.latency_buckets = [10, 50, 100, 200, 500, 1000, 5000]
-        self.histograms: Dict[Tuple[str, frozenset], List[float]] = {}
-        self.histogram_sums: Dict[Tuple[str, frozenset], float] = {}
-        self.histogram_counts: Dict[Tuple[str, frozenset], int] = {}
+        self.latency_buckets = (10, 50, 100, 200, 500, 1000, 5000)
+        # Rendered le label values, +Inf last, matching each bucket array row
+        self._le_strs = tuple(str(le) for le in self.latency_buckets) + ("+Inf",)
+
+        # http_requests_total and request_latency_ms share one row per (path, status).
+        # Columns are flat arrays indexed by row (struct-of-arrays) instead of
+        # separate dicts keyed by label sets.
+        self._http_idx: Dict[Tuple[str, str], int] = {}
+        self._http_labels: List[Tuple[str, str]] = []
+        # Rendered 'path="...",status="..."' per row, built when the row is created
+        self._http_label_strs: List[str] = []
+        self._http_counts = array.array("Q")
+        self._http_sums = array.array("d")
+        self._http_buckets: List[array.array] = []
 
     @classmethod
     def get_instance(cls):
@@ -25,71 +44,63 @@ class Metrics:
                     cls._instance = cls()
         return cls._instance
 
-    def _get_label_key(self, labels: Dict[str, str]) -> frozenset:
-        return frozenset(labels.items())
-
     def record_http_request(self, path: str, status: int, latency_ms: float):
-        labels = {"path": path, "status": str(status)}
-        label_key = self._get_label_key(labels)
+        key = (path, str(status))
         
-        with self._lock:
-            # Increment Counter
-            key = ("http_requests_total", label_key)
-            self.counters[key] = self.counters.get(key, 0.0) + 1.0
-            
-            # Record Latency in Histogram
-            hist_key = ("request_latency_ms", label_key)
-            if hist_key not in self.histograms:
-                self.histograms[hist_key] = [0.0] * (len(self.latency_buckets) + 1)
-                self.histogram_sums[hist_key] = 0.0
-                self.histogram_counts[hist_key] = 0
-            
-            # Update buckets (Prometheus buckets are cumulative)
-            for i, le in enumerate(self.latency_buckets):
-                if latency_ms <= le:
-                    self.histograms[hist_key][i] += 1.0
-            # +Inf bucket always increments
-            self.histograms[hist_key][-1] += 1.0
-            
-            self.histogram_sums[hist_key] += latency_ms
-            self.histogram_counts[hist_key] += 1
+        row = self._http_idx.get(key)
+        if row is None:
+            row = len(self._http_labels)
+            self._http_idx[key] = row
+            self._http_labels.append(key)
+            self._http_label_strs.append(f'path="{path}",status="{key[1]}"')
+            self._http_counts.append(0)
+            self._http_sums.append(0.0)
+            self._http_buckets.append(array.array("Q", [0] * (len(self.latency_buckets) + 1)))
+        
+        # Update buckets (Prometheus buckets are cumulative): every bucket from
+        # the first le >= latency_ms up to and including +Inf is incremented
+        buckets = self._http_buckets[row]
+        for i in range(bisect.bisect_left(self.latency_buckets, latency_ms), len(buckets)):
+            buckets[i] += 1
+        
+        self._http_counts[row] += 1
+        self._http_sums[row] += latency_ms
 
     def record_webhook_result(self, result: str):
-        labels = {"result": result}
-        label_key = self._get_label_key(labels)
-        with self._lock:
-            key = ("webhook_requests_total", label_key)
-            self.counters[key] = self.counters.get(key, 0.0) + 1.0
+        self._inc_counter(("webhook_requests_total", result), ("result",))
+
+    def _inc_counter(self, key: Tuple[str, ...], label_names: Tuple[str, ...]):
+        value = self.counters.get(key)
+        if value is None:
+            value = 0.0
+            label_str = ",".join(f'{k}="{v}"' for k, v in zip(label_names, key[1:]))
+            self._counter_label_strs[key] = "{" + label_str + "}" if label_str else ""
+        self.counters[key] = value + 1.0
 
     def render_metrics(self) -> str:
-        lines = []
-        with self._lock:
-            # Render Counters
-            for (name, label_key), value in self.counters.items():
-                label_str = ""
-                if label_key:
-                    label_str = "{" + ",".join(f'{k}="{v}"' for k, v in sorted(label_key)) + "}"
-                lines.append(f"{name}{label_str} {value}")
+        buf = io.StringIO()
+        w = buf.write
+        # Render Counters
+        label_strs = self._counter_label_strs
+        for key, value in self.counters.items():
+            w(f"{key[0]}{label_strs[key]} {value}\n")
 
-            # Render Histograms
-            for (name, label_key), buckets in self.histograms.items():
-                base_label_str = ",".join(f'{k}="{v}"' for k, v in sorted(label_key))
-                if base_label_str:
-                    base_label_str += ","
-                
-                for i, le in enumerate(self.latency_buckets):
-                    lines.append(f'{name}_bucket{{{base_label_str}le="{le}"}} {buckets[i]}')
-                
-                # +Inf
-                lines.append(f'{name}_bucket{{{base_label_str}le="+Inf"}} {buckets[-1]}')
-                
-                # Sum and Count
-                suffix = base_label_str.rstrip(",")
-                label_section = f"{{{suffix}}}" if suffix else ""
-                lines.append(f'{name}_sum{label_section} {self.histogram_sums[(name, label_key)]}')
-                lines.append(f'{name}_count{label_section} {self.histogram_counts[(name, label_key)]}')
+        for row, label_str in enumerate(self._http_label_strs):
+            w(f'http_requests_total{{{label_str}}} {self._http_counts[row]}\n')
+
+        # Render Histograms
+        name = "request_latency_ms"
+        for row, label_str in enumerate(self._http_label_strs):
+            # Built once per series and reused for every bucket line, +Inf included
+            base = f'{name}_bucket{{{label_str},le="'
+            for le, count in zip(self._le_strs, self._http_buckets[row]):
+                w(f'{base}{le}"}} {count}\n')
+            
+            # Sum and Count
+            w(f'{name}_sum{{{label_str}}} {self._http_sums[row]}\n')
+            w(f'{name}_count{{{label_str}}} {self._http_counts[row]}\n')
 
-        return "\n".join(lines) + "\n"
+        return buf.getvalue()
 
 # For backwards compatibility or simplified access
 metrics = Metrics.get_instance()
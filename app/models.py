@@ -1,4 +1,3 @@
-import re
 from datetime import datetime, timezone
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel, Field, field_validator, ConfigDict
@@ -15,7 +14,10 @@ class WebhookMessageIn(BaseModel):
     @field_validator('sender', 'receiver')
     @classmethod
     def validate_phone(cls, v: str, info) -> str:
-        if not re.match(r"^\+[0-9]+$", v):
+        # Equivalent to ^\+[0-9]+$ using C-level str methods; isascii() keeps
+        # non-ASCII digits (e.g. "²") out, since isdigit() alone accepts them.
+        digits = v[1:]
+        if not (digits and v[0] == "+" and digits.isascii() and digits.isdigit()):
             raise ValueError(f"{info.field_name} must be in E.164 format (+[digits]+)")
         return v
 
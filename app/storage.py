@@ -1,45 +1,121 @@
 import aiosqlite
+import asyncio
+import contextlib
 import logging
 import re
 from typing import Optional, List, Dict, Any, Tuple
-from datetime import datetime, timezone
+from datetime import datetime
+
+from app.logging_utils import _iso_now
 
 logger = logging.getLogger(__name__)
 
+_SQLITE_URL_RE = re.compile(r"sqlite:\/\/\/(.+)")
+
+# Kept as a constant so the connection's statement cache is always hit.
+# Duplicates are detected before the batch insert; OR IGNORE is a safety net.
+_INSERT_MESSAGE_SQL = (
+    "INSERT OR IGNORE INTO messages (message_id, from_msisdn, to_msisdn, ts, text, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+# Most rows the writer task commits in a single transaction
+_WRITE_BATCH_SIZE = 256
+
 class Storage:
     def __init__(self, db_url: str):
         # Handle sqlite:////data/app.db format
         # aiosqlite needs the file path directly.
         self.db_path = self._parse_db_url(db_url)
+        # Single long-lived connection, opened in init_db and shared by all methods
+        self._conn: Optional[aiosqlite.Connection] = None
+        # Webhook inserts are queued and group-committed by a single writer task
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
 
     def _parse_db_url(self, db_url: str) -> str:
         # Simple parser for sqlite:///path or sqlite:////path
-        match = re.match(r"sqlite:\/\/\/(.+)", db_url)
+        match = _SQLITE_URL_RE.match(db_url)
         if match:
             return match.group(1)
         return db_url # Fallback if not matching expected pattern
 
     async def init_db(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    message_id TEXT PRIMARY KEY,
-                    from_msisdn TEXT NOT NULL,
-                    to_msisdn TEXT NOT NULL,
-                    ts TEXT NOT NULL,
-                    text TEXT,
-                    created_at TEXT NOT NULL
-                )
-            """)
-            # Indices for performance
-            await db.execute("CREATE INDEX IF NOT EXISTS idx_ts ON messages (ts)")
-            await db.execute("CREATE INDEX IF NOT EXISTS idx_from ON messages (from_msisdn)")
-            await db.commit()
+        if self._conn is None:
+            # Autocommit mode: every statement commits on its own
+            self._conn = await aiosqlite.connect(self.db_path, isolation_level=None)
+            self._conn.row_factory = aiosqlite.Row
+            # WAL + synchronous=NORMAL drops the per-insert fsync
+            await self._conn.execute("PRAGMA journal_mode=WAL")
+            await self._conn.execute("PRAGMA synchronous=NORMAL")
+            await self._conn.execute("PRAGMA temp_store=MEMORY")
+            await self._conn.execute("PRAGMA mmap_size=268435456")
+
+        db = self._conn
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                message_id TEXT PRIMARY KEY,
+                from_msisdn TEXT NOT NULL,
+                to_msisdn TEXT NOT NULL,
+                ts TEXT NOT NULL,
+                text TEXT,
+                created_at TEXT NOT NULL
+            )
+        """)
+        # Indices for performance. Both match the /messages ORDER BY (ts, message_id),
+        # so filtered lists are read in index order without a temp b-tree sort.
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_from_ts ON messages (from_msisdn, ts, message_id)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_ts_msgid ON messages (ts, message_id)")
+        # Superseded by the composite indices above
+        await db.execute("DROP INDEX IF EXISTS idx_ts")
+        await db.execute("DROP INDEX IF EXISTS idx_from")
+
+        # Full-text index over text. The trigram tokenizer keeps the substring
+        # semantics of the old LIKE '%q%' filter while using an index lookup.
+        async with db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'") as cursor:
+            fts_exists = await cursor.fetchone() is not None
+        await db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                text, content='messages', content_rowid='rowid', tokenize='trigram'
+            )
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts (rowid, text) VALUES (new.rowid, new.text);
+            END
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+            END
+        """)
+        await db.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+                INSERT INTO messages_fts (rowid, text) VALUES (new.rowid, new.text);
+            END
+        """)
+        if not fts_exists:
+            # Index rows written before the FTS table existed
+            await db.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+        self._ensure_writer()
+
+    async def close(self):
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._writer_task
+            self._writer_task = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
 
     async def check_connection(self) -> bool:
+        if self._conn is None:
+            return False
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("SELECT 1")
+            await self._conn.execute("SELECT 1")
             return True
         except Exception:
             return False
@@ -48,93 +124,165 @@ class Storage:
         """
         Returns True if inserted, False if duplicate.
         """
-        now = datetime.now(timezone.utc).isoformat()
-        ts_str = ts.isoformat() if isinstance(ts, datetime) else ts
-        
-        try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute(
-                    "INSERT INTO messages (message_id, from_msisdn, to_msisdn, ts, text, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-                    (message_id, sender, receiver, ts_str, text, now)
-                )
-                await db.commit()
-                return True
-        except aiosqlite.IntegrityError as e:
-            if "UNIQUE constraint failed" in str(e):
-                return False
-            raise e
+        now = _iso_now()
+        # ts is a validated datetime from WebhookMessageIn
+        ts_str = ts.isoformat()
+
+        self._ensure_writer()
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(((message_id, sender, receiver, ts_str, text, now), fut))
+        return await fut
+
+    def _ensure_writer(self):
+        # (Re)start the writer on the running loop, e.g. if init_db ran on another loop
+        loop = asyncio.get_running_loop()
+        task = self._writer_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._writer_task = loop.create_task(self._writer_loop(self._queue))
+
+    async def _writer_loop(self, queue: asyncio.Queue):
+        # Group commit: drain whatever queued up while the previous batch was
+        # being written and commit it in one transaction (one fsync per batch).
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < _WRITE_BATCH_SIZE:
+                try:
+                    batch.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            try:
+                results = await self._write_batch([params for params, _ in batch])
+            except Exception as e:
+                logger.exception("Failed to write batch of %d messages", len(batch))
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            else:
+                for (_, fut), inserted in zip(batch, results):
+                    if not fut.done():
+                        fut.set_result(inserted)
+
+    async def _write_batch(self, rows: List[tuple]) -> List[bool]:
+        """
+        Inserts rows in one transaction. Returns per-row True if inserted, False if duplicate.
+        """
+        db = self._conn
+        placeholders = ",".join("?" * len(rows))
+        async with db.execute(
+            f"SELECT message_id FROM messages WHERE message_id IN ({placeholders})",
+            [row[0] for row in rows]
+        ) as cursor:
+            seen = {row[0] for row in await cursor.fetchall()}
+
+        # The writer task is the only writer, so ids not found above are new;
+        # a repeated id within the batch counts as a duplicate of the first.
+        results = []
+        new_rows = []
+        for row in rows:
+            if row[0] in seen:
+                results.append(False)
+            else:
+                seen.add(row[0])
+                new_rows.append(row)
+                results.append(True)
+
+        if new_rows:
+            await db.execute("BEGIN")
+            try:
+                await db.executemany(_INSERT_MESSAGE_SQL, new_rows)
+                await db.execute("COMMIT")
+            except Exception:
+                await db.execute("ROLLBACK")
+                raise
+        return results
 
     async def query_messages(self, limit: int, offset: int, from_filter: Optional[str], since: Optional[datetime], q: Optional[str]) -> Tuple[List[Dict[str, Any]], int]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            
-            base_query = "FROM messages WHERE 1=1"
-            params = []
-            
-            if from_filter:
-                base_query += " AND from_msisdn = ?"
-                params.append(from_filter)
-            
-            if since:
-                base_query += " AND ts >= ?"
-                params.append(since.isoformat() if isinstance(since, datetime) else since)
-                
-            if q:
+        db = self._conn
+
+        base_query = "FROM messages WHERE 1=1"
+        params = []
+
+        if from_filter:
+            base_query += " AND from_msisdn = ?"
+            params.append(from_filter)
+
+        if since:
+            base_query += " AND ts >= ?"
+            params.append(since.isoformat() if isinstance(since, datetime) else since)
+
+        if q:
+            if len(q) >= 3:
+                # Quoted as an FTS phrase so any FTS syntax in q is matched literally
+                base_query += " AND rowid IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)"
+                params.append('"' + q.replace('"', '""') + '"')
+            else:
+                # Trigrams cannot match queries shorter than 3 characters
                 base_query += " AND text LIKE ?"
                 params.append(f"%{q}%")
 
-            # Count total
+        # Fetch data and the filtered total in one pass
+        data_query = f"SELECT *, COUNT(*) OVER () AS _total {base_query} ORDER BY ts ASC, message_id ASC LIMIT ? OFFSET ?"
+        data_params = params + [limit, offset]
+
+        async with db.execute(data_query, data_params) as cursor:
+            rows = await cursor.fetchall()
+
+        if rows:
+            total = rows[0]["_total"]
+        elif offset:
+            # Paged past the end: no row carries the total, so count separately
             async with db.execute(f"SELECT COUNT(*) {base_query}", params) as cursor:
                 total_row = await cursor.fetchone()
                 total = total_row[0]
+        else:
+            total = 0
 
-            # Fetch data
-            data_query = f"SELECT * {base_query} ORDER BY ts ASC, message_id ASC LIMIT ? OFFSET ?"
-            data_params = params + [limit, offset]
-            
-            async with db.execute(data_query, data_params) as cursor:
-                rows = await cursor.fetchall()
-                
-            data = []
-            for row in rows:
-                data.append({
-                    "message_id": row["message_id"],
-                    "from": row["from_msisdn"],
-                    "to": row["to_msisdn"],
-                    "ts": row["ts"],
-                    "text": row["text"]
-                })
-            return data, total
+        data = []
+        for row in rows:
+            # Stored via isoformat() as +00:00; the API returns UTC with a Z suffix
+            ts = row["ts"]
+            if ts.endswith("+00:00"):
+                ts = ts[:-6] + "Z"
+            data.append({
+                "message_id": row["message_id"],
+                "from": row["from_msisdn"],
+                "to": row["to_msisdn"],
+                "ts": ts,
+                "text": row["text"]
+            })
+        return data, total
 
     async def compute_stats(self) -> Dict[str, Any]:
-        async with aiosqlite.connect(self.db_path) as db:
-            stats = {}
-            
-            # Total messages
-            async with db.execute("SELECT COUNT(*) FROM messages") as cursor:
-                row = await cursor.fetchone()
-                stats["total_messages"] = row[0]
-            
-            # Senders count
-            async with db.execute("SELECT COUNT(DISTINCT from_msisdn) FROM messages") as cursor:
-                row = await cursor.fetchone()
-                stats["senders_count"] = row[0]
-                
-            # First/Last ts
-            async with db.execute("SELECT MIN(ts), MAX(ts) FROM messages") as cursor:
-                row = await cursor.fetchone()
-                stats["first_message_ts"] = row[0]
-                stats["last_message_ts"] = row[1]
-                
-            # Top 10 senders
-            async with db.execute("""
-                SELECT from_msisdn, COUNT(*) as cnt 
-                FROM messages 
-                GROUP BY from_msisdn 
-                ORDER BY cnt DESC 
-                LIMIT 10
-            """) as cursor:
-                rows = await cursor.fetchall()
-                stats["messages_per_sender"] = {row[0]: row[1] for row in rows}
-                
-            return stats
\ No newline at end of file
+        db = self._conn
+        stats = {}
+
+        # Total messages
+        async with db.execute("SELECT COUNT(*) FROM messages") as cursor:
+            row = await cursor.fetchone()
+            stats["total_messages"] = row[0]
+
+        # Senders count
+        async with db.execute("SELECT COUNT(DISTINCT from_msisdn) FROM messages") as cursor:
+            row = await cursor.fetchone()
+            stats["senders_count"] = row[0]
+
+        # First/Last ts
+        async with db.execute("SELECT MIN(ts), MAX(ts) FROM messages") as cursor:
+            row = await cursor.fetchone()
+            stats["first_message_ts"] = row[0]
+            stats["last_message_ts"] = row[1]
+
+        # Top 10 senders
+        async with db.execute("""
+            SELECT from_msisdn, COUNT(*) as cnt
+            FROM messages
+            GROUP BY from_msisdn
+            ORDER BY cnt DESC
+            LIMIT 10
+        """) as cursor:
+            rows = await cursor.fetchall()
+            stats["messages_per_sender"] = {row[0]: row[1] for row in rows}
+
+        return stats
\ No newline at end of file